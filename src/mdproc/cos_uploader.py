@@ -1,46 +1,165 @@
 # -*- coding=utf-8
+import functools
+import hashlib
 import logging
+import mimetypes
 import os
+import sqlite3
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from dotenv import load_dotenv
 from qcloud_cos import CosConfig, CosS3Client
+from qcloud_cos.cos_exception import CosServiceError
 
-load_dotenv()
+# Max number of concurrent uploads, also the size of the connection pool
+MAX_WORKERS = 8
+# Read files in chunks instead of loading them into memory
+CHUNK_SIZE = 1 << 20
 
-secret_id = os.environ["COS_SECRET_ID"]
-secret_key = os.environ["COS_SECRET_KEY"]
-COS_REGION = os.environ["COS_REGION"]
-COS_BUCKET = os.environ["COS_BUCKET"]
-COS_URL_PREFIX = f"https://{COS_BUCKET}.cos.{COS_REGION}.myqcloud.com/"
 
-token = None  # To use the temporary key, a Token is required. By default, it is empty.
-scheme = "https"
-config = CosConfig(
-    Region=COS_REGION,
-    SecretId=secret_id,
-    SecretKey=secret_key,
-    Token=token,
-    Scheme=scheme,
-)
-cos_client = CosS3Client(config)
+@functools.lru_cache(maxsize=1)
+def _get_bucket() -> str:
+    load_dotenv()
+    return os.environ["COS_BUCKET"]
+
+
+def _get_url_prefix() -> str:
+    return f"https://{_get_bucket()}.cos.{os.environ['COS_REGION']}.myqcloud.com/"
+
+
+@functools.lru_cache(maxsize=1)
+def _get_client() -> CosS3Client:
+    """
+    Create the COS client on first use, so importing this module
+    does not require the COS environment variables.
+    """
+    load_dotenv()
+    token = None  # To use the temporary key, a Token is required. By default, it is empty.
+    scheme = "https"
+    config = CosConfig(
+        Region=os.environ["COS_REGION"],
+        SecretId=os.environ["COS_SECRET_ID"],
+        SecretKey=os.environ["COS_SECRET_KEY"],
+        Token=token,
+        Scheme=scheme,
+        PoolConnections=MAX_WORKERS,
+        PoolMaxSize=MAX_WORKERS,
+    )
+    return CosS3Client(config)
+
+
+# Local index of uploaded objects {bucket/cos_key: url}, skips the head_object round-trip
+CACHE_HOME = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+CACHE_DIR = Path(CACHE_HOME) / "mdproc"
+COS_INDEX_PATH = CACHE_DIR / "cos_index.sqlite"
+
+
+def _connect_index() -> sqlite3.Connection:
+    # One connection per call, so upload() can run in multiple threads
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(COS_INDEX_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS uploads (key TEXT PRIMARY KEY, url TEXT)")
+    return conn
+
+
+def _index_get(index_key: str) -> str | None:
+    conn = _connect_index()
+    try:
+        row = conn.execute(
+            "SELECT url FROM uploads WHERE key = ?", (index_key,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def _index_put(index_key: str, url: str) -> None:
+    conn = _connect_index()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (key, url) VALUES (?, ?)",
+                (index_key, url),
+            )
+    finally:
+        conn.close()
+
+
+def _object_exists(cos_key: str) -> bool:
+    try:
+        _get_client().head_object(Bucket=_get_bucket(), Key=cos_key)
+    except CosServiceError as e:
+        if e.get_status_code() == 404:
+            return False
+        raise
+    return True
+
+
+def file_digest(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    h = hashlib.blake2b(digest_size=12)
+    with open(path, "rb") as fp:
+        while chunk := fp.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
 
 
 def upload(png_path: Path) -> str:
-    png_filename = png_path.name
-    cos_key = f"imgs/{png_filename}"
-    with open(png_path, "rb") as fp:
-        cos_client.put_object(
-            Bucket=COS_BUCKET,
-            Body=fp,
+    """
+    Upload a file to COS, keyed by its content hash.
+    Files already uploaded (same bytes) are not uploaded again.
+    """
+    digest = file_digest(png_path)
+    cos_key = f"imgs/{digest}{png_path.suffix}"
+    index_key = f"{_get_bucket()}/{cos_key}"
+
+    png_url = _index_get(index_key)
+    if png_url is not None:
+        return png_url
+
+    if not _object_exists(cos_key):
+        content_type = mimetypes.guess_type(png_path)[0] or "application/octet-stream"
+        # Stream from disk, large files are uploaded in multiple parts.
+        # Parts go one at a time: upload_many already fills the connection pool.
+        _get_client().upload_file(
+            Bucket=_get_bucket(),
             Key=cos_key,
+            LocalFilePath=str(png_path),
+            PartSize=8,
+            MAXThread=1,
+            EnableMD5=False,
             StorageClass="STANDARD",
-            ContentType="image/png",
+            ContentType=content_type,
         )
-    png_url = COS_URL_PREFIX + cos_key
+    png_url = _get_url_prefix() + cos_key
+    _index_put(index_key, png_url)
     return png_url
 
+
+def upload_many(paths: list[Path], max_workers: int = MAX_WORKERS) -> dict[Path, str]:
+    """
+    Upload files to COS concurrently.
+
+    Returns:
+        Dictionary mapping {path: cos_url}. Failed uploads are reported and left out.
+    """
+    results = {}
+    if not paths:
+        return results
+    # Create the shared client before the worker threads use it
+    _get_client()
+    with ThreadPoolExecutor(max_workers) as ex:
+        futures = {ex.submit(upload, p): p for p in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"  Upload failed for {path}: {e}")
+    return results
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
     # Use the directory of this script for demo.png
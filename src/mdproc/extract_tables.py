@@ -1,15 +1,19 @@
 from markdown_it import MarkdownIt
 
+# Configure the parser to enable tables (GFM-like is a good preset).
+# Built once and reused, the parser is not modified after configuration.
+_MD = MarkdownIt("gfm-like", {"linkify": False}).enable("table")
+
 
 def extract_raw_tables(md_text):
     """
     Extracts the raw markdown strings of tables from a given markdown text.
     """
-    # Configure the parser to enable tables (GFM-like is a good preset)
-    md = MarkdownIt("gfm-like", {"linkify": False}).enable("table")
-
     # Parse the markdown into tokens
-    tokens = md.parse(md_text, {})
+    tokens = _MD.parse(md_text, {})
+
+    # Split once, the token source maps are line numbers
+    lines = md_text.splitlines()
 
     raw_tables = []
     current_table_start = None
@@ -25,9 +29,7 @@ def extract_raw_tables(md_text):
             if current_table_start is not None and token.map:
                 current_table_end = token.map[1]
                 # Extract the relevant lines from the original text
-                table_lines = md_text.splitlines()[
-                    current_table_start:current_table_end
-                ]
+                table_lines = lines[current_table_start:current_table_end]
                 raw_tables.append("\n".join(table_lines))
                 current_table_start = None
 
@@ -1,6 +1,10 @@
 import re
 import os
 import argparse
+
+_IMG_LINE_RE = re.compile(r"!\[.*?\]\(.*?\)")
+
+
 def main():
     # delete (multi) empty lines before and after img tags
     parser = argparse.ArgumentParser(
@@ -10,38 +14,34 @@ def main():
     args = parser.parse_args()
     input_file = args.input_file
     output_file = f"{os.path.splitext(input_file)[0]}_4zhihu.md"
-    with open(input_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    new_lines = []
-    i = 0
-    n = len(lines)
     img_tag_count = 0
     removed_empty_count = 0
-    while i < n:
-        line = lines[i]
-        stripped = line.strip()
-        if re.match(r"!\[.*?\]\(.*?\)", stripped):
-            img_tag_count += 1
-            # Remove all empty lines before img tag
-            before = len(new_lines)
-            while new_lines and new_lines[-1].strip() == "":
-                new_lines.pop()
-            removed_empty_count += before - len(new_lines)
-            new_lines.append(line)
-            # Skip all empty lines after img tag
-            j = i + 1
-            after = 0
-            while j < n and lines[j].strip() == "":
-                after += 1
-                j += 1
-            removed_empty_count += after
-            i = j
-        else:
-            new_lines.append(line)
-            i += 1
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.writelines(new_lines)
+    # Stream line by line, only consecutive empty lines are buffered
+    with open(input_file, "r", encoding="utf-8") as fin, open(
+        output_file, "w", encoding="utf-8"
+    ) as fout:
+        pending_empty = []  # empty lines not written yet, dropped before img tag
+        after_img = False
+        for line in fin:
+            stripped = line.strip()
+            if stripped == "":
+                if after_img:
+                    # Skip all empty lines after img tag
+                    removed_empty_count += 1
+                else:
+                    pending_empty.append(line)
+                continue
+            if _IMG_LINE_RE.match(stripped):
+                img_tag_count += 1
+                # Remove all empty lines before img tag
+                removed_empty_count += len(pending_empty)
+                after_img = True
+            else:
+                fout.writelines(pending_empty)
+                after_img = False
+            pending_empty.clear()
+            fout.write(line)
+        fout.writelines(pending_empty)
     print(f"Image tags: {img_tag_count}, removed empty lines: {removed_empty_count}")
 
 if __name__ == "__main__":
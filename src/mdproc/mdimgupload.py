@@ -1,6 +1,8 @@
 """
 Markdown Image Uploader to COS
 """
+import asyncio
+import contextlib
 import urllib.parse
 import httpx
 
@@ -14,16 +16,84 @@ import re
 import tempfile
 
 from dotenv import load_dotenv
-from .cos_uploader import upload
+from .cos_uploader import upload_many
 
 load_dotenv()
 
+# Max number of concurrent img downloads
+MAX_CONNECTIONS = 16
+CHUNK_SIZE = 1 << 20
+
+# Regex to match img URLs in markdown image tags
+# url example: ![alt text](http://example.com/image.png?param=value#anchor)
+_IMG_RE = re.compile(r"!\[(.*?)\]\((https?://[^\s)]+?\.(?:png|jpg|jpeg|gif)(?:\?[^\s)#]*)?(?:#[^\s)]*)?)\)")
+
+
 def get_img_filename(url):
     url = urllib.parse.unquote(url)
     # Remove query parameters and anchor in url
     url = url.split('?', 1)[0].split('#', 1)[0]
     return os.path.basename(url)
 
+
+def get_img_path(url, img_dir):
+    # Use a hash or basename for unique filename
+    basename = get_img_filename(url)
+    name, ext = os.path.splitext(basename)
+    # Use hash to avoid collision
+    url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()[:8]
+    img_filename = f"{name}_{url_hash}{ext}"
+    return os.path.join(img_dir, img_filename)
+
+
+async def fetch(url, img_path, client, sem):
+    async with sem:
+        print(f"Downloading {url}")
+        async with client.stream("GET", url, timeout=10) as resp:
+            resp.raise_for_status()
+            # Stream the body into a .part file instead of buffering it in memory,
+            # and only move it into place once complete, so no truncated img is left
+            part_path = img_path + ".part"
+            f = await asyncio.to_thread(open, part_path, "wb")
+            try:
+                with f:
+                    async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                os.replace(part_path, img_path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(part_path)
+                raise
+    print(f"Saved img to {img_path}")
+
+
+async def gather_all(url_paths):
+    """
+    Download all imgs concurrently, url_paths maps img URL to local img path.
+
+    Returns:
+        The url_paths entries downloaded successfully. Failed ones are reported.
+    """
+    sem = asyncio.Semaphore(MAX_CONNECTIONS)
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS)
+    async with httpx.AsyncClient(http2=True, limits=limits) as client:
+        results = await asyncio.gather(
+            *[
+                fetch(url, img_path, client, sem)
+                for url, img_path in url_paths.items()
+            ],
+            return_exceptions=True,
+        )
+
+    downloaded = {}
+    for (url, img_path), result in zip(url_paths.items(), results):
+        if isinstance(result, Exception):
+            print(f"Download failed for {url}: {result}")
+        else:
+            downloaded[url] = img_path
+    return downloaded
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Upload images in a Markdown file to COS."
@@ -34,64 +104,44 @@ def main():
 
     output_file = f"{os.path.splitext(input_file)[0]}_output.md"
 
-    with open(input_file, "r", encoding="utf-8") as f:
-        content = f.read()
+    content = Path(input_file).read_text(encoding="utf-8")
 
     # Directory to store temporary imgs
     img_dir = os.path.join(tempfile.gettempdir(), "mdimgupload")
     os.makedirs(img_dir, exist_ok=True)
 
-    # Regex to match img URLs in markdown image tags
-    # url example: ![alt text](http://example.com/image.png?param=value#anchor)
-    pattern = re.compile(r"!\[(.*?)\]\((https?://[^\s)]+?\.(?:png|jpg|jpeg|gif)(?:\?[^\s)#]*)?(?:#[^\s)]*)?)\)")
-    matches = list(pattern.finditer(content))
+    # Skip the regex scan if there is no img tag at all
+    matches = list(_IMG_RE.finditer(content)) if "![" in content else []
     print(f"Find {len(matches)} img links")
 
-    # download imgs
-    url_paths = {}  # Map from img URL to local img path
-    for match in matches:
-        url = match.group(2)
-        if url in url_paths:
-            img_path = url_paths[url]
-            print(f"Reusing img for {url} -> {img_path}")
-            continue
-        # Use a hash or basename for unique filename
-        basename = get_img_filename(url)
-        name, ext = os.path.splitext(basename)
-        # Use hash to avoid collision
-        url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()[:8]
-        img_filename = f"{name}_{url_hash}{ext}"
-        img_path = os.path.join(img_dir, img_filename)
-
-        # Download the img to local path
-        print(f"Downloading {url}")
-        resp = httpx.get(url, timeout=10)
-        resp.raise_for_status()
-
-        with open(img_path, "wb") as f:
-            f.write(resp.content)
-        print(f"Saved img to {img_path}")
-
-        url_paths[url] = img_path
+    # download imgs, each unique URL only once
+    url_set = dict.fromkeys(match.group(2) for match in matches)
+    # Map from img URL to local img path
+    url_paths = {url: get_img_path(url, img_dir) for url in url_set}
+    url_paths = asyncio.run(gather_all(url_paths))
 
-    # upload imgs to COS
+    # upload imgs to COS, imgs uploaded before are skipped by upload()
+    print(f"Uploading {len(url_paths)} imgs")
+    uploaded = upload_many([Path(img_path) for img_path in url_paths.values()])
     img_to_url_map = {}
     for url, img_path in url_paths.items():
-        print(f"Uploading {img_path}")
-        img_url = upload(Path(img_path))
-        img_to_url_map[url] = img_url
-        print(f"Uploaded to COS: {img_url}")
+        img_url = uploaded.get(Path(img_path))
+        if img_url is not None:
+            img_to_url_map[url] = img_url
+            print(f"Uploaded to COS: {img_url}")
 
-    # Replace all occurrences of the img URLs in the content img tags
+    # Replace the img URLs in the content img tags,
+    # imgs failed to download or upload are left unchanged
     def replace_img_with_url(match):
         img_url = match.group(2)
-        return f"![{match.group(1)}]({img_to_url_map.get(img_url)})"
+        if img_url not in img_to_url_map:
+            return match.group(0)
+        return f"![{match.group(1)}]({img_to_url_map[img_url]})"
 
-    new_content = pattern.sub(replace_img_with_url, content)
+    new_content = _IMG_RE.sub(replace_img_with_url, content) if matches else content
 
     # Write the modified content to output file
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(new_content)
+    Path(output_file).write_text(new_content, encoding="utf-8")
     print(f"Written output to {output_file}")
 
 
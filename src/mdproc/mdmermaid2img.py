@@ -17,17 +17,24 @@ from dotenv import load_dotenv
 
 import argparse
 
+import hashlib
 import os
 import re
 import tempfile
 from pathlib import Path
 from typing import Optional, Tuple, Dict, List
 
-from .mermaid2img_playwright import render_mermaid_playwright
-from .cos_uploader import upload
+from .mermaid2img_playwright import (
+    render_mermaid_playwright,
+    render_mermaid_playwright_batch,
+)
+from .cos_uploader import upload_many
 
 load_dotenv()
 
+# Pattern to match ```mermaid ... ```
+_MERMAID_RE = re.compile(r"```mermaid\n(.*?)\n```", re.DOTALL)
+
 
 def extract_mermaid_code(markdown_content: str) -> list[Tuple[str, str]]:
     """
@@ -41,9 +48,11 @@ def extract_mermaid_code(markdown_content: str) -> list[Tuple[str, str]]:
         - mermaid_code: Clean mermaid code without markdown fences
         - original_block: Original markdown block including fences
     """
-    # Pattern to match ```mermaid ... ```
-    pattern = r"```mermaid\n(.*?)\n```"
-    matches = re.finditer(pattern, markdown_content, re.DOTALL)
+    # Cheap literal check before running the regex over the whole document
+    if "```mermaid" not in markdown_content:
+        return []
+
+    matches = _MERMAID_RE.finditer(markdown_content)
 
     results = []
     for match in matches:
@@ -54,6 +63,34 @@ def extract_mermaid_code(markdown_content: str) -> list[Tuple[str, str]]:
     return results
 
 
+def mermaid_image_path(
+    mermaid_code: str,
+    output_dir: Optional[str] = None,
+    theme: str = "default",
+    scale: int = 2,
+) -> str:
+    """
+    Get the image path for mermaid code, creating output_dir if needed.
+    The filename is a stable hash of the code and render options,
+    so an existing file can be reused across runs.
+    """
+    if output_dir is None:
+        output_dir = os.path.join(tempfile.gettempdir(), "mermaid2img")
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Generate unique filename based on mermaid code hash
+    code_hash = hashlib.blake2b(
+        f"{theme}\0{scale}\0{mermaid_code}".encode("utf-8"), digest_size=8
+    ).hexdigest()
+    output_filename = f"mermaid_{code_hash}.png"
+    return os.path.join(output_dir, output_filename)
+
+
+def is_cached(output_path: str) -> bool:
+    return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+
+
 def mermaid_to_image(
     mermaid_code: str,
     output_dir: Optional[str] = None,
@@ -72,15 +109,9 @@ def mermaid_to_image(
     Returns:
         Path to the generated image file
     """
-    if output_dir is None:
-        output_dir = os.path.join(tempfile.gettempdir(), "mermaid2img")
-
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Generate unique filename based on mermaid code hash
-    code_hash = hash(mermaid_code) & 0x7FFFFFFF
-    output_filename = f"mermaid_{code_hash}.png"
-    output_path = os.path.join(output_dir, output_filename)
+    output_path = mermaid_image_path(mermaid_code, output_dir, theme, scale)
+    if is_cached(output_path):
+        return output_path
 
     # Render mermaid code to image
     render_mermaid_playwright(mermaid_code, output_path, theme=theme, scale=scale)
@@ -119,22 +150,33 @@ def convert_mermaid_in_markdown(
 
     image_map = {}  # {original_block: img_path}
 
-    # Convert each mermaid block to image
-    for i, (mermaid_code, original_block) in enumerate(mermaid_blocks, 1):
-        try:
-            print(f"Converting block {i}/{len(mermaid_blocks)}...")
+    # Render each unique mermaid code once, the same diagram may appear many times
+    unique_codes = {}  # {mermaid_code: img_path}
+    for mermaid_code, _ in mermaid_blocks:
+        if mermaid_code not in unique_codes:
+            unique_codes[mermaid_code] = mermaid_image_path(
+                mermaid_code, img_output_dir, theme, scale
+            )
+    if len(unique_codes) < len(mermaid_blocks):
+        print(f"{len(unique_codes)} unique mermaid blocks")
+
+    # Convert all mermaid blocks to images in one browser session,
+    # images rendered by a previous run are reused
+    rendered = {img_path for img_path in unique_codes.values() if is_cached(img_path)}
+    if rendered:
+        print(f"Reusing {len(rendered)} cached images")
+    to_render = [item for item in unique_codes.items() if item[1] not in rendered]
+    rendered.update(
+        render_mermaid_playwright_batch(to_render, theme=theme, scale=scale)
+    )
 
-            # Convert to image
-            img_path = mermaid_to_image(mermaid_code, img_output_dir, theme, scale)
+    for mermaid_code, original_block in mermaid_blocks:
+        img_path = unique_codes[mermaid_code]
+        if img_path in rendered:
             print(f"  Generated: {img_path}")
-
             # Store mapping
             image_map[original_block] = img_path
 
-        except Exception as e:
-            print(f"  Error: {e}")
-            continue
-
     return markdown_content, image_map
 
 
@@ -148,20 +190,15 @@ def upload_mermaid_images_to_cos(local_image_paths: List[str]) -> Dict[str, str]
     Returns:
         Dictionary mapping {img_path: cos_url}
     """
-    upload_results = {}
-
-    for i, img_path in enumerate(local_image_paths, 1):
-        try:
-            print(f"Uploading image {i}/{len(local_image_paths)}...")
-            print(f"  Source: {img_path}")
+    print(f"Uploading {len(local_image_paths)} images...")
+    path_to_str = {Path(img_path): img_path for img_path in local_image_paths}
+    uploaded = upload_many(list(path_to_str))
 
-            cos_url = upload(Path(img_path))
-            upload_results[img_path] = cos_url
-            print(f"  COS URL: {cos_url}")
-
-        except Exception as e:
-            print(f"  Upload failed: {e}")
-            continue
+    upload_results = {}
+    for path, cos_url in uploaded.items():
+        img_path = path_to_str[path]
+        upload_results[img_path] = cos_url
+        print(f"  {img_path} -> COS URL: {cos_url}")
 
     return upload_results
 
@@ -183,8 +220,10 @@ def replace_mermaid_with_images(
     Returns:
         Updated markdown content with image links
     """
-    updated_content = markdown_content
+    if not mermaid_to_img_map:
+        return markdown_content
 
+    lookup = {}  # {original_block: image_link}
     for i, (original_block, img_path) in enumerate(mermaid_to_img_map.items(), 1):
         # Determine image URL: COS if available, otherwise local path
         if img_to_url_map and img_path in img_to_url_map:
@@ -194,11 +233,13 @@ def replace_mermaid_with_images(
             raise ValueError(f"No COS URL found for image path: {img_path}")
 
         # Create markdown image link
-        image_link = f"![mermaid {i}]({image_url})"
-        # Replace original mermaid block
-        updated_content = updated_content.replace(original_block, image_link)
+        lookup[original_block] = f"![mermaid {i}]({image_url})"
 
-    return updated_content
+    # Replace all original mermaid blocks in a single pass, longest block first
+    pattern = re.compile(
+        "|".join(re.escape(block) for block in sorted(lookup, key=len, reverse=True))
+    )
+    return pattern.sub(lambda m: lookup[m.group(0)], markdown_content)
 
 
 def process_mermaid_markdown_3steps(
@@ -224,8 +265,7 @@ def process_mermaid_markdown_3steps(
         Tuple of (final_markdown_content, results_dict)
     """
     # Read markdown file once
-    with open(markdown_path, "r", encoding="utf-8") as f:
-        markdown_content = f.read()
+    markdown_content = Path(markdown_path).read_text(encoding="utf-8")
 
     if output_path is None:
         output_path = markdown_path
@@ -237,9 +277,10 @@ def process_mermaid_markdown_3steps(
     )
 
     if not mermaid_to_img_map:
-        print("No mermaid blocks found. Writing unchanged content.")
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
+        # Nothing to write back if the output is the input itself
+        if output_path != markdown_path:
+            print("No mermaid blocks found. Writing unchanged content.")
+            Path(output_path).write_text(markdown_content, encoding="utf-8")
         return markdown_content, {}
 
     results = {"images": mermaid_to_img_map}
@@ -259,12 +300,17 @@ def process_mermaid_markdown_3steps(
         markdown_content, mermaid_to_img_map, img_to_url_map
     )
 
+    if final_content == markdown_content and output_path == markdown_path:
+        print("Content unchanged, skip writing output file.")
+        return final_content, results
+
     # Write file ONCE
     print("Writing output file...")
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(final_content)
+    Path(output_path).write_text(final_content, encoding="utf-8")
     print(f"Output saved to: {output_path}")
 
+    return final_content, results
+
 
 def main():
     parser = argparse.ArgumentParser(
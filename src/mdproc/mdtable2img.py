@@ -5,36 +5,46 @@ table with many columns: the table is spread out horizontally.
 """
 
 import argparse
+import hashlib
 import os
 import re
 import tempfile
+from collections import deque
 from pathlib import Path
 
 from dotenv import load_dotenv
 from markdown_it import MarkdownIt
 from playwright.sync_api import sync_playwright
 
-from .cos_uploader import upload
+from .cos_uploader import upload_many
+from .mermaid2img_playwright import launch_browser
 
 load_dotenv()
 
+# Built once and reused for all tables
+_MD = MarkdownIt("gfm-like", {"linkify": False}).enable("table")
+# re is simple than markdown-it table extractor for our use case
+_TABLE_RE = re.compile(r"(?:^\s*\|.*\|\s*\n)+", re.MULTILINE)
+
 
 def extract_tables(md_text):
-    # re is simple than markdown-it table extractor for our use case
-    table_pattern = re.compile(r"(?:^\s*\|.*\|\s*\n)+", re.MULTILINE)
-    return [m.group(0) for m in table_pattern.finditer(md_text)]
+    if "|" not in md_text:
+        return []
+    return [m.group(0) for m in _TABLE_RE.finditer(md_text)]
+
+
+def table_image_hash(table_md):
+    return hashlib.blake2b(table_md.encode("utf-8"), digest_size=8).hexdigest()
 
 
-def table_to_image(md_text, output_path):
+def table_to_image(page, md_text, output_path):
     # md_text = """
     # | A | B | C | D | E | F | G |
     # |---|---|---|---|---|---|---|
     # | 1 | 2 | 3 | 4 | 5 | 6 | 7 |
     # """
 
-    html_table = (
-        MarkdownIt("gfm-like", {"linkify": False}).enable("table").render(md_text)
-    )
+    html_table = _MD.render(md_text)
     html_table = html_table.replace("<table", '<table id="mdtable2img"', 1)
 
     html = f"""
@@ -62,13 +72,33 @@ def table_to_image(md_text, output_path):
     </html>
     """
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page(viewport={"width": 2000, "height": 800})
-        page.set_content(html)
-        table_locator = page.locator("#mdtable2img")
-        table_locator.screenshot(path=output_path)
-        browser.close()
+    page.set_content(html)
+    table_locator = page.locator("#mdtable2img")
+    table_locator.screenshot(path=output_path)
+
+
+def replace_tables_with_images(content, tables, images, img_to_url_map):
+    """
+    Replace each table with its image link in a single pass over content.
+    Tables whose image failed to upload are left unchanged.
+    """
+    # A table may occur more than once, its occurrences are replaced in order
+    lookup = {}  # {table_md: deque of img_md}
+    for i, (table_md, img_path) in enumerate(zip(tables, images)):
+        cos_url = img_to_url_map.get(Path(img_path))
+        img_md = f"![Table {i + 1}]({cos_url})\n" if cos_url else None
+        lookup.setdefault(table_md, deque()).append(img_md)
+    if not lookup:
+        return content
+
+    def replace_table(match):
+        img_mds = lookup[match.group(0)]
+        img_md = img_mds.popleft() if img_mds else None
+        return img_md if img_md is not None else match.group(0)
+
+    sources = sorted(lookup, key=len, reverse=True)
+    pattern = re.compile("|".join(re.escape(table_md) for table_md in sources))
+    return pattern.sub(replace_table, content)
 
 
 def main():
@@ -91,22 +121,32 @@ def main():
     # Process tables and convert to images
     tables = extract_tables(content)
     print(f"Find {len(tables)} tables")
-    images = []
-    for i, table_md in enumerate(tables):
-        img_path = os.path.join(img_dir, f"table_{i + 1}.png")
-        table_to_image(table_md, img_path)
-        print(f"Converted table {i + 1} to image: {img_path}")
-        images.append(img_path)
+    # Name images by table content hash, so unchanged tables are not re-rendered
+    images = [
+        os.path.join(img_dir, f"table_{table_image_hash(table_md)}.png")
+        for table_md in tables
+    ]
+    to_render = [
+        (i, table_md, img_path)
+        for i, (table_md, img_path) in enumerate(zip(tables, images))
+        if not (os.path.exists(img_path) and os.path.getsize(img_path) > 0)
+    ]
+    print(f"Reusing {len(tables) - len(to_render)} cached table images")
+    if to_render:
+        # Launch the browser once and render all tables in the same page
+        with sync_playwright() as p:
+            browser = launch_browser(p)
+            page = browser.new_page(viewport={"width": 2000, "height": 800})
+            for i, table_md, img_path in to_render:
+                table_to_image(page, table_md, img_path)
+                print(f"Converted table {i + 1} to image: {img_path}")
+            browser.close()
     print(f"Converted {len(images)} tables to images.")
 
     # Upload images to COS and replace in markdown
-    for i, img_path in enumerate(images):
-        cos_url = upload(Path(img_path))
-        # Replace the first occurrence of the table markdown with image markdown
-        table_md = tables[i]
-        img_md = f"![Table {i + 1}]({cos_url})\n"
-        content = content.replace(table_md, img_md, 1)
-    print(f"Uploaded {len(images)} table images to COS.")
+    img_to_url_map = upload_many([Path(img_path) for img_path in images])
+    print(f"Uploaded {len(img_to_url_map)} table images to COS.")
+    content = replace_tables_with_images(content, tables, images, img_to_url_map)
 
     with open(output_file, "w", encoding="utf-8") as f:
         f.write(content)
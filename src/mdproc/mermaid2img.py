@@ -4,11 +4,7 @@ import shutil
 import subprocess
 
 
-def render_mermaid_cli(code: str, output_path: str, theme="default", scale=1):
-    """
-    Render mermaid code to image using mermaid-cli.
-    Supports Chinese and other Unicode characters.
-    """
+def find_mmdc() -> str:
     mmdc_path = os.environ.get("MMDC_PATH") or shutil.which("mmdc")
     if mmdc_path and os.name == "nt":
         candidate_cmd = f"{mmdc_path}.cmd"
@@ -18,6 +14,21 @@ def render_mermaid_cli(code: str, output_path: str, theme="default", scale=1):
         raise FileNotFoundError(
             "mmdc not found. Add it to PATH or set MMDC_PATH to the full path "
         )
+    return mmdc_path
+
+
+def to_bytes(code: str | bytes) -> bytes:
+    # Explicitly specify UTF-8 encoding to support Chinese
+    return code if isinstance(code, (bytes, bytearray)) else code.encode("utf-8")
+
+
+def render_mermaid_cli(code: str | bytes, output_path: str, theme="default", scale=1):
+    """
+    Render mermaid code to image using mermaid-cli.
+    Supports Chinese and other Unicode characters.
+    code may be already UTF-8 encoded bytes, to avoid encoding again.
+    """
+    mmdc_path = find_mmdc()
 
     cmd = [
         mmdc_path,
@@ -35,9 +46,7 @@ def render_mermaid_cli(code: str, output_path: str, theme="default", scale=1):
 
     process = subprocess.run(
         cmd,
-        input=code.encode(
-            "utf-8"
-        ),  # Explicitly specify UTF-8 encoding to support Chinese
+        input=to_bytes(code),
         capture_output=True,
         text=False,  # Receive as bytes to avoid encoding issues
     )
@@ -48,6 +57,79 @@ def render_mermaid_cli(code: str, output_path: str, theme="default", scale=1):
         raise RuntimeError(f"mermaid-cli execution failed: {stderr_msg}")
 
 
+def render_mermaid_cli_batch(
+    codes: list[str | bytes], out_dir: str, theme="default", scale=1
+) -> list[str]:
+    """
+    Render many mermaid codes with a single mermaid-cli invocation.
+    All codes are written into one markdown file, so node/mmdc starts only once.
+
+    Returns:
+        Image paths in out_dir, in the same order as codes.
+
+    Raises:
+        RuntimeError: If mermaid-cli fails or does not write every image
+    """
+    if not codes:
+        return []
+    mmdc_path = find_mmdc()
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Build the fixture as bytes once
+    fixture = b"\n\n".join(
+        b"```mermaid\n" + to_bytes(code) + b"\n```" for code in codes
+    )
+    with tempfile.NamedTemporaryFile(mode="wb", suffix=".md", delete=False) as f:
+        tmp_md = f.name
+        f.write(fixture)
+
+    # mermaid-cli writes the i-th diagram to m-<i>.png. Render into a fresh dir,
+    # so images left in out_dir by an earlier run are never taken for this one's.
+    render_dir = tempfile.mkdtemp(prefix="mmdc_")
+    cmd = [
+        mmdc_path,
+        "-i",
+        tmp_md,
+        "-o",
+        os.path.join(render_dir, "m.png"),
+        "--outputFormat",
+        "png",
+        "--theme",
+        theme,
+        "--scale",
+        str(scale),
+        "--backgroundColor",
+        "white",
+    ]
+
+    try:
+        try:
+            process = subprocess.run(cmd, capture_output=True, text=False)
+        finally:
+            os.remove(tmp_md)
+
+        if process.returncode != 0:
+            stderr_msg = process.stderr.decode("utf-8", errors="replace")
+            print("Error:", stderr_msg)
+            raise RuntimeError(f"mermaid-cli execution failed: {stderr_msg}")
+
+        names = [f"m-{i}.png" for i in range(1, len(codes) + 1)]
+        missing = [
+            name for name in names if not os.path.isfile(os.path.join(render_dir, name))
+        ]
+        if missing:
+            raise RuntimeError(f"mermaid-cli did not write {', '.join(missing)}")
+
+        output_paths = []
+        for name in names:
+            output_path = os.path.join(out_dir, name)
+            shutil.move(os.path.join(render_dir, name), output_path)
+            output_paths.append(output_path)
+        return output_paths
+    finally:
+        shutil.rmtree(render_dir, ignore_errors=True)
+
+
 def main():
     demo_code = """
     flowchart TD
@@ -4,137 +4,975 @@ Render Mermaid diagrams to images using Playwright.
 Alternative to mermaid-cli that uses browser rendering.
 """
 
+import asyncio
+import atexit
+import functools
+import hashlib
+import io
 import os
+import re
+import shutil
 import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from contextlib import contextmanager
 from pathlib import Path
-from playwright.sync_api import sync_playwright
+from typing import Literal, Optional
 
+from playwright.async_api import async_playwright
 
-def render_mermaid_playwright(
+# Get the absolute path to your local bundle
+# Copy from https://github.com/Honghe/mermaid-bundle/blob/master/mermaid.bundle.js
+ASSETS_DIR = Path(__file__).parent / "assets"
+MERMAID_BUNDLE_PATH = ASSETS_DIR / "mermaid.bundle.js"
+# A flowchart diagram declaration, at the start of a line (case-insensitive)
+_FLOWCHART_RE = re.compile(r"(?im)^\s*flowchart\b")
+# Formats a diagram can be rendered to, svg skips rasterization,
+# webp needs Pillow (pip install mdproc[webp])
+OUTPUT_FORMATS = ("png", "svg", "webp")
+# Upper bound in ms to wait for mermaid to render a diagram
+RENDER_TIMEOUT = 10_000
+# Each worker process pays a browser launch, so batches are only split over
+# processes with at least this many diagrams per process
+PROCESS_MIN_DIAGRAMS = 16
+# Bounding box of the rendered SVG, used to clip the screenshot
+SVG_BBOX_JS = """() => {
+    const r = document.querySelector('#diagram svg').getBoundingClientRect();
+    return {x: r.x, y: r.y, width: Math.ceil(r.width), height: Math.ceil(r.height)};
+}"""
+
+
+@functools.lru_cache(maxsize=1)
+def _bundle_version() -> str:
+    # Rendered images depend on the mermaid bundle, changing it invalidates the cache
+    try:
+        stat = MERMAID_BUNDLE_PATH.stat()
+    except OSError:
+        return ""
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+@functools.lru_cache(maxsize=1)
+def _bundle_script() -> str:
+    # Read once, every new context injects it as an init script
+    return MERMAID_BUNDLE_PATH.read_text(encoding="utf-8")
+
+
+def _cache_dir() -> Path:
+    cache_dir = os.environ.get("MDPROC_MERMAID_CACHE_DIR") or (
+        Path(tempfile.gettempdir()) / "mdproc_mermaid_cache"
+    )
+    return Path(cache_dir)
+
+
+def cache_key(
     mermaid_code: str,
-    output_path: str,
     theme: str = "default",
     background_color: str = "white",
     scale: float = 2.0,
     layout: str = "elk",
-) -> None:
+    output_format: str = "png",
+) -> str:
     """
-    Render mermaid diagram to PNG image using Playwright.
+    Content address of a rendered image: the diagram code and every render option.
+    Used as the file name in the cache dir, so it ends with the format extension.
+    """
+    h = hashlib.sha256()
+    # scale=2 and scale=2.0 render the same image, so they share a key
+    for part in (mermaid_code, theme, background_color, repr(float(scale)), layout):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    h.update(_bundle_version().encode("utf-8"))
+    return f"{h.hexdigest()}.{output_format}"
 
-    Args:
-        mermaid_code: Raw mermaid diagram code (without ```mermaid fences)
-        output_path: Path to save the output PNG image
-        theme: Mermaid theme ("default", "dark", "forest", "neutral")
-        background_color: Background color (CSS color)
-        scale: Device scale factor for higher resolution (default 2.0)
-        layout: Layout engine for flowchart ("dagre" or "elk"). Only applies to flowchart type.
 
-    Raises:
-        RuntimeError: If rendering fails
+# {cache_key: cached image path}, avoids repeated stat() in batch runs
+_cache_hits: dict[str, Path] = {}
+
+
+def _cache_lookup(key: str) -> Optional[Path]:
+    cached = _cache_hits.get(key)
+    if cached is None:
+        cached = _cache_dir() / key
+        if not cached.exists():
+            return None
+        _cache_hits[key] = cached
+    return cached
+
+
+def _output_record_path(output_path: str) -> Path:
+    # Records the image last written to output_path. Kept in the cache dir,
+    # keyed by the absolute output path, not next to the user's images.
+    path_hash = hashlib.sha256(os.path.abspath(output_path).encode("utf-8"))
+    return _cache_dir() / "outputs" / path_hash.hexdigest()
+
+
+def _output_record(key: str, stat: os.stat_result) -> str:
+    # The cache key, plus mtime and inode to notice the file changed since
+    return f"{key} {stat.st_mtime_ns} {stat.st_ino}"
+
+
+def _is_up_to_date(key: str, output_path: str) -> bool:
+    try:
+        record = _output_record_path(output_path).read_text()
+        stat = os.stat(output_path)
+    except OSError:
+        return False
+    return record == _output_record(key, stat)
+
+
+def _copy_to_output(cached: Path, key: str, output_path: str) -> None:
     """
-    # Determine if we need flowchart layout config
-    # ELK layout only works for flowchart diagrams
-    is_flowchart = "flowchart" in mermaid_code.lower()
-
-    if is_flowchart and layout != "dagre":
-        flowchart_config = f"""
-            flowchart: {{
-                defaultRenderer: '{layout}'
-            }},"""
-    else:
-        flowchart_config = ""
-
-    # Get the absolute path to your local bundle
-    assets_dir = Path(__file__).parent / "assets"
-    # Copy from https://github.com/Honghe/mermaid-bundle/blob/master/mermaid.bundle.js
-    mermaid_bundle_path = (assets_dir / "mermaid.bundle.js").absolute().as_uri()
-
-    # HTML template with Mermaid.js
-    html_template = """
+    Copy the cached image to output_path and record it. A copy, not a link,
+    so tools rewriting the output in place can't change the cached image.
+    """
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(cached, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    record_path = _output_record_path(output_path)
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    record_path.write_text(_output_record(key, os.stat(output_path)))
+
+
+def _copy_cached(key: str, output_path: str) -> bool:
+    """
+    Bring output_path up to date from the cache, return False on cache miss.
+    """
+    if _is_up_to_date(key, output_path):
+        # Written from the same key before, nothing to do
+        return True
+    cached = _cache_lookup(key)
+    if cached is None:
+        return False
+    try:
+        _copy_to_output(cached, key, output_path)
+    except FileNotFoundError:
+        # Removed from the cache dir after lookup, render it again
+        _cache_hits.pop(key, None)
+        return False
+    return True
+
+
+# Rendered images are written to the cache and output paths in the background,
+# so batches move on to the next diagram without waiting for the disk.
+# concurrent.futures joins its worker threads at exit, pending writes still land.
+_writer_pool = ThreadPoolExecutor(max_workers=2)
+
+
+@contextmanager
+def _cache_writer(key: str):
+    """
+    Yield a temp path to render into, moved to the cache on success,
+    so the cache never holds a partial image.
+    """
+    cache_dir = _cache_dir()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cached = cache_dir / key
+    tmp_path = cache_dir / f"{os.getpid()}.{threading.get_ident()}.tmp.{key}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, cached)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    _cache_hits[key] = cached
+
+
+# Page the diagrams are rendered into, loaded once per page.
+# Mermaid itself comes from the context init script.
+SHELL_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
-    <script src="{mermaid_bundle_path}"></script>
-    <script type="module">
-        mermaid.initialize({{ 
-            startOnLoad: true,
-            theme: '{theme}',
-            securityLevel: 'loose',
-            {flowchart_config}
-        }});
-    </script>
     <style>
-        body {{
+        * {
+            animation: none !important;
+            transition: none !important;
+        }
+        body {
             margin: 0;
-            padding: 20px;
-            background-color: {background_color};
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            min-height: 100vh;
-        }}
-        #diagram {{
+        }
+        #diagram {
             max-width: 100%;
-        }}
+            transform-origin: top left;
+        }
     </style>
 </head>
 <body>
-    <div class="mermaid" id="diagram">
-{mermaid_code}
-    </div>
+    <div id="diagram"></div>
 </body>
 </html>
 """
 
-    html_content = html_template.format(
-        theme=theme,
-        background_color=background_color,
-        mermaid_code=mermaid_code,
-        flowchart_config=flowchart_config,
-        mermaid_bundle_path=mermaid_bundle_path,
+# Render one diagram into #diagram with mermaid.render(), without reloading the page.
+# A render that timed out keeps running, so the page must not be reused after a failure.
+RENDER_JS = """async ({ code, config, background, scale, timeout }) => {
+    document.body.style.backgroundColor = background;
+    const diagram = document.getElementById('diagram');
+    diagram.innerHTML = '';
+    // Scale the vector diagram instead of the device pixel ratio, so only
+    // the diagram is rasterized at high resolution, not the whole viewport
+    diagram.style.transform = `scale(${scale})`;
+    const configKey = JSON.stringify(config);
+    if (window.__mdprocConfig !== configKey) {
+        mermaid.initialize(config);
+        window.__mdprocConfig = configKey;
+    }
+    // A fresh id per render, mermaid uses it for the SVG and its temp elements
+    window.__mdprocRenderSeq = (window.__mdprocRenderSeq || 0) + 1;
+    const id = `mermaid-svg-${window.__mdprocRenderSeq}`;
+    let timer;
+    const timedOut = new Promise((_, reject) => {
+        timer = setTimeout(
+            () => reject(new Error(`mermaid render timed out after ${timeout} ms`)),
+            timeout,
+        );
+    });
+    try {
+        const { svg } = await Promise.race([mermaid.render(id, code), timedOut]);
+        diagram.innerHTML = svg;
+        return svg;
+    } finally {
+        clearTimeout(timer);
+    }
+}"""
+
+
+def mermaid_config(
+    mermaid_code: str, theme: str = "default", layout: str = "elk"
+) -> dict:
+    """
+    Options passed to mermaid.initialize() for a diagram.
+    """
+    config = {"startOnLoad": False, "theme": theme, "securityLevel": "loose"}
+    # ELK layout only works for flowchart diagrams
+    if layout != "dagre" and _FLOWCHART_RE.search(mermaid_code):
+        config["flowchart"] = {"defaultRenderer": layout}
+    return config
+
+
+def _render_args(mermaid_code, theme, background_color, scale, layout, timeout) -> dict:
+    return {
+        "code": mermaid_code,
+        "config": mermaid_config(mermaid_code, theme, layout),
+        "background": background_color,
+        "scale": scale,
+        "timeout": timeout,
+    }
+
+
+# Chromium subsystems not needed to render an inline SVG, skipping them
+# cuts browser start-up time and memory
+CHROMIUM_ARGS = [
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-translate",
+    "--disable-sync",
+    "--disable-features=Translate,BackForwardCache,IsolateOrigins,site-per-process",
+    "--no-first-run",
+    "--mute-audio",
+]
+
+
+def _launch_options() -> dict:
+    sandbox = os.environ.get("MDPROC_CHROMIUM_SANDBOX") == "1"
+    args = list(CHROMIUM_ARGS)
+    if not sandbox:
+        # Zygote process is only useful with the sandbox
+        args.append("--no-zygote")
+    return {"headless": True, "chromium_sandbox": sandbox, "args": args}
+
+
+def launch_browser(playwright):
+    """
+    Launch headless Chromium with CHROMIUM_ARGS.
+
+    The Chromium sandbox stays disabled (Playwright's default) unless
+    MDPROC_CHROMIUM_SANDBOX=1, for security-sensitive deployments.
+    """
+    return playwright.chromium.launch(**_launch_options())
+
+
+async def launch_browser_async(playwright):
+    """
+    Same as launch_browser, for the async Playwright API.
+    """
+    return await playwright.chromium.launch(**_launch_options())
+
+
+class _PagePool:
+    """
+    Warm pages of one async browser, each in its own context with SHELL_HTML
+    loaded, handed out to render diagrams and kept for the next render.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self._idle = []
+
+    async def acquire(self):
+        while self._idle:
+            page = self._idle.pop()
+            if not page.is_closed():
+                return page
+        context = await new_context_async(self.browser)
+        try:
+            return await open_page_async(context)
+        except BaseException:
+            await context.close()
+            raise
+
+    def release(self, page) -> None:
+        self._idle.append(page)
+
+    async def discard(self, page) -> None:
+        try:
+            await page.context.close()
+        except Exception:
+            pass  # The browser is already gone
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for page in idle:
+            await self.discard(page)
+
+
+class _BrowserHolder:
+    """
+    Chromium launched on first use and shared by all render calls,
+    so the browser start-up cost is paid once per process.
+
+    The browser is driven by async Playwright on an event loop of its own
+    thread. Sync callers block on run(), async callers await submit(), and
+    nothing is left running on the caller's thread, so both APIs mix freely.
+    Warm pages are pooled, see _PagePool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._launch_lock = None
+        self._playwright = None
+        self._browser = None
+        self._pages = None
+
+    def submit(self, coro) -> Future:
+        """
+        Schedule coro on the holder's loop. Must not be called from that loop.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    async def pages(self) -> _PagePool:
+        # Runs on the holder's loop, the lock keeps concurrent renders from
+        # launching a browser each
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                await self._close_browser()
+                self._playwright = await async_playwright().start()
+                self._browser = await launch_browser_async(self._playwright)
+                self._pages = _PagePool(self._browser)
+            return self._pages
+
+    def close(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._close_browser(), loop).result()
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+                self._loop = None
+                self._thread = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._launch_lock = asyncio.Lock()
+                # Daemon, so it still runs the atexit close()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="mdproc-playwright", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    async def _close_browser(self):
+        try:
+            if self._browser is not None:
+                await self._browser.close()
+        finally:
+            if self._playwright is not None:
+                await self._playwright.stop()
+            self._browser = None
+            self._playwright = None
+            self._pages = None
+
+
+_browser_holder = _BrowserHolder()
+atexit.register(_browser_holder.close)
+
+
+def close_browser() -> None:
+    """
+    Close the shared browser. It is launched again on next use.
+    """
+    _browser_holder.close()
+
+
+def _reuse_browser() -> bool:
+    return os.environ.get("MDPROC_PLAYWRIGHT_REUSE", "1") != "0"
+
+
+# Rendering scale is applied with a CSS transform, see RENDER_JS,
+# so contexts keep device_scale_factor=1 and serve every scale
+CONTEXT_OPTIONS = {
+    "viewport": {"width": 800, "height": 800},
+    "device_scale_factor": 1,
+    # Nothing to animate in a screenshot
+    "reduced_motion": "reduce",
+    "color_scheme": "light",
+    "bypass_csp": True,
+    "service_workers": "block",
+}
+
+
+async def new_context_async(browser):
+    """
+    Create a browser context with the mermaid bundle preloaded in every page.
+    """
+    context = await browser.new_context(**CONTEXT_OPTIONS)
+    await context.add_init_script(script=_bundle_script())
+    return context
+
+
+async def open_page_async(context):
+    """
+    Open a page with SHELL_HTML loaded and mermaid ready,
+    diagrams are then rendered into it with capture_diagram_async().
+    """
+    page = await context.new_page()
+    await page.set_content(SHELL_HTML, wait_until="load")
+    await page.wait_for_function("window.mermaid !== undefined", timeout=RENDER_TIMEOUT)
+    return page
+
+
+def save_image(image: bytes, output_path: str, output_format: str = "png") -> None:
+    """
+    Save the output of capture_diagram_async() to output_path.
+    """
+    if output_format != "webp":
+        Path(output_path).write_bytes(image)
+        return
+
+    # Chromium only encodes png and jpeg screenshots, webp goes through Pillow
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("webp output requires Pillow: pip install mdproc[webp]")
+    with Image.open(io.BytesIO(image)) as png:
+        png.save(output_path, "WEBP", quality=85, method=6)
+
+
+async def capture_diagram_async(
+    page,
+    mermaid_code: str,
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    timeout: float = RENDER_TIMEOUT,
+    output_format: str = "png",
+) -> bytes:
+    """
+    Render a mermaid diagram in a page from open_page_async().
+
+    Returns:
+        Mermaid's SVG if output_format is "svg", else a PNG screenshot of the diagram.
+        Raises if rendering fails or takes longer than timeout ms.
+    """
+    svg = await page.evaluate(
+        RENDER_JS,
+        _render_args(mermaid_code, theme, background_color, scale, layout, timeout),
+    )
+    if output_format == "svg":
+        return svg.encode("utf-8")
+
+    # Screenshot only the SVG bounding box, no surrounding whitespace
+    bbox = await page.evaluate(SVG_BBOX_JS)
+    return await page.screenshot(
+        type="png",
+        clip=bbox,
+        full_page=True,
+        omit_background=(background_color == "transparent"),
+    )
+
+
+def _store_rendered(key: str, image: bytes, output_format: str, output_paths) -> None:
+    # Runs in _writer_pool. Misses are deduplicated by key,
+    # so concurrent writes never share a temp path
+    with _cache_writer(key) as tmp_path:
+        save_image(image, str(tmp_path), output_format)
+    for output_path in output_paths:
+        _copy_to_output(_cache_hits[key], key, output_path)
+
+
+def _set_failed(failures: dict, output_paths, e: Exception) -> None:
+    for output_path in output_paths:
+        failures[output_path] = e
+
+
+def _cache_misses(items, theme, background_color, scale, layout, output_format):
+    """
+    Copy cache hits to their output path, return the rest as
+    [(mermaid_code, output_path, cache_key)].
+    """
+    misses = []
+    for mermaid_code, output_path in items:
+        key = cache_key(
+            mermaid_code, theme, background_color, scale, layout, output_format
+        )
+        if not _copy_cached(key, output_path):
+            misses.append((mermaid_code, output_path, key))
+    return misses
+
+
+def _dedupe_misses(misses) -> dict[str, tuple[str, list[str]]]:
+    # {cache_key: (mermaid_code, [output_path])}, each distinct diagram renders once
+    by_key = {}
+    for mermaid_code, output_path, key in misses:
+        by_key.setdefault(key, (mermaid_code, []))[1].append(output_path)
+    return by_key
+
+
+async def _render_misses_async(
+    pages, misses, theme, background_color, scale, layout, output_format, concurrency
+) -> dict[str, Exception]:
+    """
+    Render (mermaid_code, output_path, cache_key) items with pages of a _PagePool,
+    concurrency of them rendering at the same time.
+
+    Returns:
+        Dictionary mapping {output_path: error} of failed items.
+    """
+    pending = list(_dedupe_misses(misses).items())
+    failures = {}
+    writes = []  # [(future, output_paths)]
+
+    async def worker():
+        page = await pages.acquire()
+        try:
+            while pending:
+                key, (mermaid_code, output_paths) = pending.pop()
+                try:
+                    image = await capture_diagram_async(
+                        page,
+                        mermaid_code,
+                        theme,
+                        background_color,
+                        scale,
+                        layout,
+                        output_format=output_format,
+                    )
+                except Exception as e:
+                    _set_failed(failures, output_paths, e)
+                    # A timed-out render may still be running, go on in a new page
+                    await pages.discard(page)
+                    page = None
+                    page = await pages.acquire()
+                    continue
+                # Write it out in the background while the next diagram renders
+                future = _writer_pool.submit(
+                    _store_rendered, key, image, output_format, output_paths
+                )
+                writes.append((asyncio.wrap_future(future), output_paths))
+        finally:
+            if page is not None:
+                pages.release(page)
+
+    n_workers = min(concurrency, len(pending))
+    errors = await asyncio.gather(
+        *(worker() for _ in range(n_workers)), return_exceptions=True
     )
+    if pending:
+        # Items are left only if every worker failed to open a page
+        error = next(
+            (e for e in errors if isinstance(e, Exception)),
+            RuntimeError("no page to render in"),
+        )
+        for _, (_, output_paths) in pending:
+            _set_failed(failures, output_paths, error)
+
+    for future, output_paths in writes:
+        try:
+            await future
+        except Exception as e:
+            _set_failed(failures, output_paths, e)
+    return failures
+
+
+async def _render_on_browser(browser, misses, *options) -> dict[str, Exception]:
+    # Pages are opened for this call only, the browser is left open
+    pages = _PagePool(browser)
+    try:
+        return await _render_misses_async(pages, misses, *options)
+    finally:
+        await pages.close()
+
+
+async def _render_misses_shared(misses, *options) -> dict[str, Exception]:
+    """
+    Runs on the holder's loop: render with the shared browser, or with a browser
+    launched only for this call if MDPROC_PLAYWRIGHT_REUSE=0.
+    """
+    if _reuse_browser():
+        pages = await _browser_holder.pages()
+        return await _render_misses_async(pages, misses, *options)
+
+    async with async_playwright() as p:
+        browser = await launch_browser_async(p)
+        try:
+            return await _render_on_browser(browser, misses, *options)
+        finally:
+            await browser.close()
+
+
+async def _render_items_async(
+    items,
+    theme,
+    background_color,
+    scale,
+    layout,
+    output_format,
+    concurrency,
+    browser=None,
+) -> dict[str, Exception]:
+    options = (theme, background_color, scale, layout, output_format)
+    misses = _cache_misses(items, *options)
+    if not misses:
+        return {}
+    concurrency = max(1, concurrency)
+    if browser is not None:
+        return await _render_on_browser(browser, misses, *options, concurrency)
+
+    # The shared browser belongs to the holder's loop, wait without blocking this one
+    future = _browser_holder.submit(
+        _render_misses_shared(misses, *options, concurrency)
+    )
+    return await asyncio.wrap_future(future)
+
+
+def _render_items(
+    items, theme, background_color, scale, layout, output_format, concurrency
+) -> dict[str, Exception]:
+    """
+    Render items, cache hits are copied without touching the browser.
+    Large batches go to worker processes, see _process_count().
+
+    Returns:
+        Dictionary mapping {output_path: error} of failed items.
+    """
+    options = (theme, background_color, scale, layout, output_format)
+    misses = _cache_misses(items, *options)
+    if not misses:
+        return {}
+    n_workers = _process_count(len(_dedupe_misses(misses)))
+    if n_workers > 1:
+        return _render_misses_in_processes(misses, *options, n_workers)
+    concurrency = max(1, concurrency)
+    return _browser_holder.run(_render_misses_shared(misses, *options, concurrency))
+
+
+def _check_output_format(output_format: str) -> None:
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unsupported output format {output_format!r}, "
+            f"expected one of {OUTPUT_FORMATS}"
+        )
+
+
+def render_mermaid_playwright_batch(
+    items: list[tuple[str, str]],
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    concurrency: Optional[int] = None,
+    output_format: Literal["png", "svg", "webp"] = "png",
+) -> list[str]:
+    """
+    Render many mermaid diagrams, spread over concurrent browser contexts.
+
+    Args:
+        items: List of (mermaid_code, output_path)
+        concurrency: Number of pages of the shared browser rendering
+            at the same time, default min(4, len(items)). Batches with at least
+            2 * PROCESS_MIN_DIAGRAMS diagrams to render are split over worker
+            processes instead, see render_many_processes().
+        Other args are the same as render_mermaid_playwright
+
+    Returns:
+        Output paths rendered successfully. Failed diagrams are reported and left out.
+    """
+    _check_output_format(output_format)
+    if not items:
+        return []
+    if concurrency is None:
+        concurrency = min(4, len(items))
+
+    failures = _render_items(
+        items, theme, background_color, scale, layout, output_format, concurrency
+    )
+    for output_path, e in failures.items():
+        print(f"  Failed to render mermaid diagram {output_path}: {e}")
+    return [output_path for _, output_path in items if output_path not in failures]
+
+
+def render_mermaid_playwright(
+    mermaid_code: str,
+    output_path: str,
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    output_format: Literal["png", "svg", "webp"] = "png",
+) -> None:
+    """
+    Render mermaid diagram to PNG image using Playwright.
 
-    # Create temporary HTML file
-    with tempfile.NamedTemporaryFile(
-        mode="w", encoding="utf-8", suffix=".html", delete=False
-    ) as f:
-        temp_html_path = f.name
-        f.write(html_content)
+    Args:
+        mermaid_code: Raw mermaid diagram code (without ```mermaid fences)
+        output_path: Path to save the output PNG image
+        theme: Mermaid theme ("default", "dark", "forest", "neutral")
+        background_color: Background color (CSS color)
+        scale: Scale factor for higher resolution (default 2.0)
+        layout: Layout engine for flowchart ("dagre" or "elk"). Only applies to flowchart type,
+            i.e. code with a line starting with "flowchart" (labels mentioning it don't count).
+        output_format: "png", "webp" (smaller, needs Pillow),
+            or "svg" to save mermaid's SVG without rasterizing it.
+            background_color and scale don't apply to SVG.
 
+    Raises:
+        RuntimeError: If rendering fails
+    """
+    _check_output_format(output_format)
     try:
-        with sync_playwright() as p:
-            # Launch browser in headless mode
-            browser = p.chromium.launch(
-                headless=True,
-            )
-            context = browser.new_context(
-                viewport={"width": 800, "height": 800},
-                device_scale_factor=scale,
-            )
-            page = context.new_page()
+        failures = _render_items(
+            [(mermaid_code, output_path)],
+            theme,
+            background_color,
+            scale,
+            layout,
+            output_format,
+            concurrency=1,
+        )
+    except Exception as e:
+        raise RuntimeError(f"Failed to render mermaid diagram: {e}")
+    if failures:
+        e = failures[output_path]
+        raise RuntimeError(f"Failed to render mermaid diagram: {e}")
+
 
-            # Load HTML file
-            page.goto(f"file://{Path(temp_html_path).as_posix()}")
+async def render_mermaid_playwright_batch_async(
+    items: list[tuple[str, str]],
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    concurrency: Optional[int] = None,
+    output_format: Literal["png", "svg", "webp"] = "png",
+    browser=None,
+) -> list[str]:
+    """
+    Async version of render_mermaid_playwright_batch.
 
-            # Wait for mermaid to render
-            page.wait_for_selector("#diagram svg", timeout=3000)
+    Args:
+        browser: Async Playwright browser to render with,
+            by default the shared browser
+        Other args are the same as render_mermaid_playwright_batch
 
-            # Get the SVG element for precise cropping
-            diagram = page.locator("#diagram")
+    Returns:
+        Output paths rendered successfully. Failed diagrams are reported and left out.
+    """
+    _check_output_format(output_format)
+    if not items:
+        return []
+    if concurrency is None:
+        concurrency = min(4, len(items))
 
-            # Take screenshot
-            diagram.screenshot(path=output_path, type="png")
+    failures = await _render_items_async(
+        items,
+        theme,
+        background_color,
+        scale,
+        layout,
+        output_format,
+        concurrency,
+        browser,
+    )
+    for output_path, e in failures.items():
+        print(f"  Failed to render mermaid diagram {output_path}: {e}")
+    return [output_path for _, output_path in items if output_path not in failures]
 
-            browser.close()
 
+async def render_mermaid_playwright_async(
+    mermaid_code: str,
+    output_path: str,
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    output_format: Literal["png", "svg", "webp"] = "png",
+    browser=None,
+) -> None:
+    """
+    Async version of render_mermaid_playwright. asyncio.gather several calls
+    to render them concurrently, on the shared browser or a given async browser.
+
+    Raises:
+        RuntimeError: If rendering fails
+    """
+    _check_output_format(output_format)
+    try:
+        failures = await _render_items_async(
+            [(mermaid_code, output_path)],
+            theme,
+            background_color,
+            scale,
+            layout,
+            output_format,
+            concurrency=1,
+            browser=browser,
+        )
     except Exception as e:
         raise RuntimeError(f"Failed to render mermaid diagram: {e}")
+    if failures:
+        e = failures[output_path]
+        raise RuntimeError(f"Failed to render mermaid diagram: {e}")
 
-    finally:
-        # Clean up temporary HTML file
-        if os.path.exists(temp_html_path):
-            os.remove(temp_html_path)
+
+def _init_worker_browser() -> None:
+    # Launch the process's shared browser up front, not on its first shard
+    if _reuse_browser():
+        try:
+            _browser_holder.run(_browser_holder.pages())
+        except Exception:
+            # An initializer error breaks the whole pool, the shard retries
+            # the launch and reports the error per item
+            pass
+
+
+def _render_shard_in_process(shard, *options) -> dict[str, str]:
+    # One page per process, the processes provide the parallelism
+    failures = _browser_holder.run(_render_misses_shared(shard, *options, 1))
+    # Playwright errors may not survive pickling, send the messages back
+    return {output_path: str(e) for output_path, e in failures.items()}
+
+
+def _process_count(n_diagrams: int) -> int:
+    """
+    Number of worker processes worth launching for n_diagrams to render,
+    1 to render them in this process.
+    """
+    if os.environ.get("MDPROC_MERMAID_PROCESSES") == "0":
+        return 1
+    return max(1, min(os.cpu_count() or 1, n_diagrams // PROCESS_MIN_DIAGRAMS))
+
+
+def _render_misses_in_processes(
+    misses, theme, background_color, scale, layout, output_format, n_workers
+) -> dict[str, Exception]:
+    """
+    Render (mermaid_code, output_path, cache_key) items in n_workers processes.
+
+    Returns:
+        Dictionary mapping {output_path: error} of failed items.
+    """
+    options = (theme, background_color, scale, layout, output_format)
+    # All outputs of a diagram go to the same shard, so it renders once
+    by_key = _dedupe_misses(misses)
+    n_workers = max(1, min(n_workers, len(by_key)))
+    shards = [[] for _ in range(n_workers)]
+    for i, (key, (mermaid_code, output_paths)) in enumerate(by_key.items()):
+        shards[i % n_workers].extend(
+            (mermaid_code, output_path, key) for output_path in output_paths
+        )
+
+    failures = {}
+    # spawn, a forked worker would inherit the parent's Playwright connection
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker_browser,
+    ) as ex:
+        futures = {
+            ex.submit(_render_shard_in_process, shard, *options): shard
+            for shard in shards
+        }
+        for future in as_completed(futures):
+            try:
+                errors = future.result()
+            except Exception as e:
+                # The worker process failed, so did all of its items
+                errors = {output_path: str(e) for _, output_path, _ in futures[future]}
+            for output_path, message in errors.items():
+                failures[output_path] = RuntimeError(message)
+    return failures
+
+
+def render_many_processes(
+    items: list[tuple[str, str]],
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    n_workers: Optional[int] = None,
+    output_format: Literal["png", "svg", "webp"] = "png",
+) -> list[str]:
+    """
+    Render many mermaid diagrams in n_workers processes, each with its own browser,
+    for corpora large enough to keep more than one CPU core busy rasterizing.
+    render_mermaid_playwright_batch() calls it on its own for large batches.
+
+    Args:
+        items: List of (mermaid_code, output_path)
+        n_workers: Number of worker processes, default os.cpu_count()
+        Other args are the same as render_mermaid_playwright
+
+    Returns:
+        Output paths rendered successfully. Failed diagrams are reported and left out.
+    """
+    _check_output_format(output_format)
+    options = (theme, background_color, scale, layout, output_format)
+    misses = _cache_misses(items, *options)
+    failures = {}
+    if misses:
+        failures = _render_misses_in_processes(
+            misses, *options, n_workers or os.cpu_count() or 1
+        )
+    for output_path, e in failures.items():
+        print(f"  Failed to render mermaid diagram {output_path}: {e}")
+    return [output_path for _, output_path in items if output_path not in failures]
 
 
 def main():
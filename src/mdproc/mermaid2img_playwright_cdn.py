@@ -4,137 +4,243 @@ Render Mermaid diagrams to images using Playwright.
 Alternative to mermaid-cli that uses browser rendering.
 """
 
+import functools
 import os
+import re
 import tempfile
-from pathlib import Path
+from typing import Optional
+
 from playwright.sync_api import sync_playwright
 
+from .mermaid2img_playwright import ASSETS_DIR, launch_browser
 
-def render_mermaid_playwright(
-    mermaid_code: str,
-    output_path: str,
-    theme: str = "default",
-    background_color: str = "white",
-    scale: float = 2.0,
-    layout: str = "elk",
-) -> None:
-    """
-    Render mermaid diagram to PNG image using Playwright.
+MERMAID_CDN_URL = "https://cdn.jsdelivr.net/npm/mermaid@11/dist/mermaid.esm.min.mjs"
+ELK_CDN_URL = "https://cdn.jsdelivr.net/npm/@mermaid-js/layout-elk@0/dist/mermaid-layout-elk.esm.min.mjs"
+# A flowchart diagram declaration, at the start of a line (case-insensitive)
+_FLOWCHART_RE = re.compile(r"(?im)^\s*flowchart\b")
+# Upper bound in ms to wait for mermaid to render a diagram
+RENDER_TIMEOUT = 10_000
+# Bounding box of the rendered SVG, used to clip the screenshot
+SVG_BBOX_JS = """() => {
+    const r = document.querySelector('#diagram svg').getBoundingClientRect();
+    return {x: r.x, y: r.y, width: Math.ceil(r.width), height: Math.ceil(r.height)};
+}"""
+# Wait for the mermaid.run() promise, but no longer than timeout ms
+WAIT_RENDERED_JS = """async (timeout) => {
+    let timer;
+    const timedOut = new Promise((_, reject) => {
+        timer = setTimeout(
+            () => reject(new Error(`mermaid render timed out after ${timeout} ms`)),
+            timeout,
+        );
+    });
+    try {
+        return await Promise.race([window.__mermaidDone, timedOut]);
+    } finally {
+        clearTimeout(timer);
+    }
+}"""
 
-    Args:
-        mermaid_code: Raw mermaid diagram code (without ```mermaid fences)
-        output_path: Path to save the output PNG image
-        theme: Mermaid theme ("default", "dark", "forest", "neutral")
-        background_color: Background color (CSS color)
-        scale: Device scale factor for higher resolution (default 2.0)
-        layout: Layout engine for flowchart ("dagre" or "elk"). Only applies to flowchart type.
 
-    Raises:
-        RuntimeError: If rendering fails
+# {path under assets/: file content}, each module is read from disk once per process
+_asset_bytes: dict[str, bytes] = {}
+
+
+@functools.lru_cache(maxsize=1)
+def _has_local_modules() -> bool:
+    return (ASSETS_DIR / "mermaid.esm.min.mjs").exists() and (
+        ASSETS_DIR / "mermaid-layout-elk.esm.min.mjs"
+    ).exists()
+
+
+def use_local_modules() -> bool:
     """
-    # Determine if we need flowchart layout config
-    # ELK layout only works for flowchart diagrams
-    is_flowchart = "flowchart" in mermaid_code.lower()
+    Whether to serve the mermaid and ELK layout ES modules from assets/.
 
-    if is_flowchart and layout != "dagre":
-        flowchart_config = f"""
-            flowchart: {{
-                defaultRenderer: '{layout}'
-            }},"""
+    Local copies avoid the network round-trip per render. Copy the dist/ contents
+    (with chunks/) of the mermaid and @mermaid-js/layout-elk npm packages there.
+    Falls back to the CDN if they are missing or MDPROC_MERMAID_CDN=1.
+    """
+    return os.environ.get("MDPROC_MERMAID_CDN") != "1" and _has_local_modules()
+
+
+def _read_asset(name: str) -> Optional[bytes]:
+    body = _asset_bytes.get(name)
+    if body is None:
+        path = ASSETS_DIR / name
+        if not path.is_file():
+            return None
+        body = _asset_bytes[name] = path.read_bytes()
+    return body
+
+
+def _fulfill_from_assets(route, request):
+    # https://cdn.jsdelivr.net/npm/<package>/dist/<path> -> assets/<path>
+    url = request.url.split("?", 1)[0].split("#", 1)[0]
+    body = _read_asset(url.split("/dist/", 1)[-1])
+    if body is not None:
+        route.fulfill(
+            status=200,
+            body=body,
+            content_type="application/javascript",
+            # Module scripts are fetched with CORS
+            headers={"Access-Control-Allow-Origin": "*"},
+        )
     else:
-        flowchart_config = ""
+        route.continue_()
 
-    # Get the absolute path to your local bundle
-    assets_dir = Path(__file__).parent / "assets"
-    mermaid_bundle_path = (assets_dir / "mermaid.bundle.js").absolute().as_uri()
 
-    # HTML template with Mermaid.js
-    html_template = """
+# HTML template with Mermaid.js, split around the diagram code.
+# Only the prefix has placeholders, it is formatted once per set of options.
+_HTML_PREFIX_TEMPLATE = """
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <script type="module">
-        import mermaid from 'https://cdn.jsdelivr.net/npm/mermaid@11/dist/mermaid.esm.min.mjs';
-        import elkLayouts from 'https://cdn.jsdelivr.net/npm/@mermaid-js/layout-elk@0/dist/mermaid-layout-elk.esm.min.mjs';
+        import mermaid from '{mermaid_url}';
+        import elkLayouts from '{elk_url}';
         mermaid.registerLayoutLoaders(elkLayouts);
         mermaid.initialize({{ 
-            startOnLoad: true,
+            startOnLoad: false,
             theme: '{theme}',
             securityLevel: 'loose',
             {flowchart_config}
         }});
+        window.__mermaidDone = mermaid.run({{ querySelector: '.mermaid' }}).then(() => true);
     </script>
     <style>
+        * {{
+            animation: none !important;
+            transition: none !important;
+        }}
         body {{
             margin: 0;
-            padding: 20px;
             background-color: {background_color};
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            min-height: 100vh;
         }}
         #diagram {{
             max-width: 100%;
+            transform: scale({scale});
+            transform-origin: top left;
         }}
     </style>
 </head>
 <body>
     <div class="mermaid" id="diagram">
-{mermaid_code}
+"""
+_HTML_SUFFIX = """
     </div>
 </body>
 </html>
 """
 
-    html_content = html_template.format(
+
+_FLOWCHART_CONFIG = """
+            flowchart: {{
+                defaultRenderer: '{layout}'
+            }},"""
+
+
+def _with_flowchart_config(layout: str) -> str:
+    # Braces of the config stay doubled, they are unescaped by _html_prefix()
+    flowchart_config = _FLOWCHART_CONFIG.replace("{layout}", layout)
+    return _HTML_PREFIX_TEMPLATE.replace("{flowchart_config}", flowchart_config)
+
+
+# Variants for the common cases, built once
+_HTML_PREFIX_PLAIN = _HTML_PREFIX_TEMPLATE.replace("{flowchart_config}", "")
+_HTML_PREFIX_ELK = _with_flowchart_config("elk")
+
+
+@functools.lru_cache(maxsize=32)
+def _html_prefix(template: str, theme: str, background_color: str, scale: float) -> str:
+    return template.format(
         theme=theme,
         background_color=background_color,
-        mermaid_code=mermaid_code,
-        flowchart_config=flowchart_config,
-        mermaid_bundle_path=mermaid_bundle_path,
+        scale=scale,
+        mermaid_url=MERMAID_CDN_URL,
+        elk_url=ELK_CDN_URL,
     )
 
-    # Create temporary HTML file
-    with tempfile.NamedTemporaryFile(
-        mode="w", encoding="utf-8", suffix=".html", delete=False
-    ) as f:
-        temp_html_path = f.name
-        f.write(html_content)
+
+def render_mermaid_playwright(
+    mermaid_code: str,
+    output_path: str,
+    theme: str = "default",
+    background_color: str = "white",
+    scale: float = 2.0,
+    layout: str = "elk",
+    timeout: float = RENDER_TIMEOUT,
+) -> None:
+    """
+    Render mermaid diagram to PNG image using Playwright.
+
+    Args:
+        mermaid_code: Raw mermaid diagram code (without ```mermaid fences)
+        output_path: Path to save the output PNG image
+        theme: Mermaid theme ("default", "dark", "forest", "neutral")
+        background_color: Background color (CSS color)
+        scale: Scale factor for higher resolution (default 2.0)
+        layout: Layout engine for flowchart ("dagre" or "elk"). Only applies to flowchart type,
+            i.e. code with a line starting with "flowchart" (labels mentioning it don't count).
+        timeout: Upper bound in ms to wait for mermaid to render the diagram
+
+    Raises:
+        RuntimeError: If rendering fails or takes longer than timeout
+    """
+    # ELK layout only works for flowchart diagrams
+    if layout == "dagre" or not _FLOWCHART_RE.search(mermaid_code):
+        template = _HTML_PREFIX_PLAIN
+    elif layout == "elk":
+        template = _HTML_PREFIX_ELK
+    else:
+        template = _with_flowchart_config(layout)
+
+    prefix = _html_prefix(template, theme, background_color, scale)
+    html_content = prefix + mermaid_code + _HTML_SUFFIX
 
     try:
         with sync_playwright() as p:
-            # Launch browser in headless mode
-            browser = p.chromium.launch(headless=True)
+            browser = launch_browser(p)
             context = browser.new_context(
                 viewport={"width": 800, "height": 800},
-                device_scale_factor=scale,
+                # Scaled with a CSS transform instead, only the diagram
+                # is rasterized at high resolution, not the whole viewport
+                device_scale_factor=1,
+                reduced_motion="reduce",
+                color_scheme="light",
+                bypass_csp=True,
+                service_workers="block",
             )
+            if use_local_modules():
+                context.route("https://cdn.jsdelivr.net/npm/**", _fulfill_from_assets)
             page = context.new_page()
 
-            # Load HTML file
-            page.goto(f"file://{Path(temp_html_path).as_posix()}")
+            # Load HTML directly
+            page.set_content(html_content, wait_until="domcontentloaded")
 
-            # Wait for mermaid to render
-            page.wait_for_selector("#diagram svg", timeout=3000)
-
-            # Get the SVG element for precise cropping
-            diagram = page.locator("#diagram")
+            # Wait for mermaid.run() to finish, not just for the first svg node.
+            # The module script sets the promise, the race bounds its settling.
+            page.wait_for_function(
+                "window.__mermaidDone !== undefined", timeout=timeout
+            )
+            page.evaluate(WAIT_RENDERED_JS, timeout)
 
-            # Take screenshot
-            diagram.screenshot(path=output_path, type="png")
+            # Screenshot only the SVG bounding box, no surrounding whitespace
+            bbox = page.evaluate(SVG_BBOX_JS)
+            page.screenshot(
+                path=output_path,
+                type="png",
+                clip=bbox,
+                full_page=True,
+                omit_background=(background_color == "transparent"),
+            )
 
             browser.close()
 
     except Exception as e:
         raise RuntimeError(f"Failed to render mermaid diagram: {e}")
 
-    finally:
-        # Clean up temporary HTML file
-        if os.path.exists(temp_html_path):
-            os.remove(temp_html_path)
-
 
 def main():
     """Demo: render mermaid diagram using Playwright."""
@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("qcloud_cos")
+
+from qcloud_cos.cos_exception import CosServiceError  # noqa: E402
+
+from mdproc import cos_uploader  # noqa: E402
+
+
+class FakeClient:
+    """
+    Records COS calls, every object is missing until uploaded.
+    """
+
+    def __init__(self):
+        self.uploads = []
+        self.heads = []
+
+    def head_object(self, Bucket, Key):
+        self.heads.append(Key)
+        if Key not in {upload["Key"] for upload in self.uploads}:
+            raise CosServiceError("HEAD", {"code": "NoSuchResource"}, 404)
+
+    def upload_file(self, **kwargs):
+        self.uploads.append(kwargs)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(cos_uploader, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(
+        cos_uploader, "COS_INDEX_PATH", tmp_path / "cache" / "cos_index.sqlite"
+    )
+    monkeypatch.setenv("COS_REGION", "ap-test")
+    monkeypatch.setattr(cos_uploader, "_get_bucket", lambda: "bucket")
+    fake = FakeClient()
+    monkeypatch.setattr(cos_uploader, "_get_client", lambda: fake)
+    return fake
+
+
+def test_index_put_get(client):
+    assert cos_uploader._index_get("bucket/imgs/a.png") is None
+    cos_uploader._index_put("bucket/imgs/a.png", "https://a")
+    assert cos_uploader._index_get("bucket/imgs/a.png") == "https://a"
+    cos_uploader._index_put("bucket/imgs/a.png", "https://b")
+    assert cos_uploader._index_get("bucket/imgs/a.png") == "https://b"
+
+
+def test_upload_keys_by_content(client, tmp_path):
+    a = tmp_path / "a.png"
+    b = tmp_path / "b.png"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+
+    url = cos_uploader.upload(a)
+    assert url == (
+        "https://bucket.cos.ap-test.myqcloud.com/imgs/"
+        f"{cos_uploader.file_digest(a)}.png"
+    )
+    # Same content under another name: found in the index, no COS request
+    assert cos_uploader.upload(b) == url
+    assert len(client.uploads) == 1
+    assert len(client.heads) == 1
+
+
+def test_upload_skips_existing_object(client, tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(b"bytes")
+    cos_uploader.upload(path)
+    # Lost index, the object is found with head_object and not uploaded again
+    cos_uploader.COS_INDEX_PATH.unlink()
+    cos_uploader.upload(path)
+    assert len(client.uploads) == 1
+    assert len(client.heads) == 2
+
+
+def test_upload_content_type(client, tmp_path):
+    for name in ("a.png", "b.jpg", "c.unknownext"):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        cos_uploader.upload(path)
+    assert [upload["ContentType"] for upload in client.uploads] == [
+        "image/png",
+        "image/jpeg",
+        "application/octet-stream",
+    ]
@@ -0,0 +1,45 @@
+import sys
+
+from mdproc import mdforzhihu
+
+
+def run_forzhihu(tmp_path, monkeypatch, text):
+    input_file = tmp_path / "doc.md"
+    input_file.write_text(text, encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["mdproc-forzhihu", str(input_file)])
+    mdforzhihu.main()
+    return (tmp_path / "doc_4zhihu.md").read_text(encoding="utf-8")
+
+
+def test_empty_lines_around_images(tmp_path, monkeypatch, capsys):
+    text = (
+        "# Title\n"
+        "\n"
+        "\n"
+        "![a](https://img/a.png)\n"
+        "\n"
+        "![b](https://img/b.png)\n"
+        "  \n"
+        "text\n"
+        "\n"
+        "more text\n"
+    )
+    assert run_forzhihu(tmp_path, monkeypatch, text) == (
+        "# Title\n"
+        "![a](https://img/a.png)\n"
+        "![b](https://img/b.png)\n"
+        "text\n"
+        "\n"
+        "more text\n"
+    )
+    assert "Image tags: 2, removed empty lines: 4" in capsys.readouterr().out
+
+
+def test_trailing_empty_lines_kept(tmp_path, monkeypatch):
+    text = "text\n\n\n"
+    assert run_forzhihu(tmp_path, monkeypatch, text) == text
+
+
+def test_no_trailing_newline(tmp_path, monkeypatch):
+    text = "text\n\n![a](https://img/a.png)"
+    assert run_forzhihu(tmp_path, monkeypatch, text) == "text\n![a](https://img/a.png)"
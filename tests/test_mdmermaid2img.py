@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("qcloud_cos")
+pytest.importorskip("playwright")
+
+from mdproc import mdmermaid2img  # noqa: E402
+
+
+def test_mermaid_image_path_is_stable(tmp_path):
+    path = mdmermaid2img.mermaid_image_path("graph TD\n A-->B", str(tmp_path))
+    assert path == mdmermaid2img.mermaid_image_path("graph TD\n A-->B", str(tmp_path))
+    assert path.startswith(str(tmp_path))
+    assert path.endswith(".png")
+
+
+def test_mermaid_image_path_covers_options(tmp_path):
+    code = "graph TD\n A-->B"
+    paths = {
+        mdmermaid2img.mermaid_image_path(code, str(tmp_path)),
+        mdmermaid2img.mermaid_image_path(code, str(tmp_path), theme="dark"),
+        mdmermaid2img.mermaid_image_path(code, str(tmp_path), scale=1),
+        mdmermaid2img.mermaid_image_path("graph TD\n A-->C", str(tmp_path)),
+    }
+    assert len(paths) == 4
+
+
+def test_replace_mermaid_with_images():
+    first = "```mermaid\ngraph TD\n A-->B\n```"
+    second = "```mermaid\ngraph TD\n A-->B\n B-->C\n```"
+    content = f"# Doc\n\n{first}\n\ntext\n\n{second}\n\n{first}\n"
+    blocks = [block for _, block in mdmermaid2img.extract_mermaid_code(content)]
+    assert blocks == [first, second, first]
+
+    result = mdmermaid2img.replace_mermaid_with_images(
+        content,
+        {first: "/img/1.png", second: "/img/2.png"},
+        {"/img/1.png": "https://cos/1.png", "/img/2.png": "https://cos/2.png"},
+    )
+    assert result == (
+        "# Doc\n\n![mermaid 1](https://cos/1.png)\n\ntext\n\n"
+        "![mermaid 2](https://cos/2.png)\n\n![mermaid 1](https://cos/1.png)\n"
+    )
+
+
+def test_replace_mermaid_without_url():
+    block = "```mermaid\ngraph TD\n A-->B\n```"
+    with pytest.raises(ValueError):
+        mdmermaid2img.replace_mermaid_with_images(block, {block: "/img/1.png"}, {})
+    assert mdmermaid2img.replace_mermaid_with_images(block, {}, {}) == block
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("qcloud_cos")
+pytest.importorskip("markdown_it")
+pytest.importorskip("playwright")
+
+from mdproc import mdtable2img  # noqa: E402
+
+TABLE = "| A | B |\n|---|---|\n| 1 | 2 |\n"
+
+
+def test_table_image_hash():
+    assert mdtable2img.table_image_hash(TABLE) == mdtable2img.table_image_hash(TABLE)
+    assert mdtable2img.table_image_hash(TABLE) != mdtable2img.table_image_hash(
+        TABLE.replace("2", "3")
+    )
+
+
+def test_replace_tables_with_images(tmp_path):
+    other = "| C |\n|---|\n| 3 |\n"
+    content = f"# Doc\n{TABLE}text\n{other}more text\n{TABLE}"
+    tables = mdtable2img.extract_tables(content)
+    assert tables == [TABLE, other, TABLE]
+    images = [str(tmp_path / f"{i}.png") for i in range(len(tables))]
+    # The image of the second table failed to upload
+    img_to_url_map = {
+        tmp_path / "0.png": "https://cos/0.png",
+        tmp_path / "2.png": "https://cos/2.png",
+    }
+
+    result = mdtable2img.replace_tables_with_images(
+        content, tables, images, img_to_url_map
+    )
+    assert result == (
+        "# Doc\n![Table 1](https://cos/0.png)\ntext\n"
+        f"{other}more text\n![Table 3](https://cos/2.png)\n"
+    )
+
+
+def test_replace_tables_without_tables():
+    assert mdtable2img.replace_tables_with_images("text\n", [], [], {}) == "text\n"
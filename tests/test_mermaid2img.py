@@ -0,0 +1,67 @@
+import os
+import subprocess
+
+import pytest
+
+from mdproc import mermaid2img
+
+
+class FakeMmdc:
+    """
+    Stands in for subprocess.run, writes m-<i>.png next to the -o path
+    for the first `written` diagrams.
+    """
+
+    def __init__(self, written, returncode=0):
+        self.written = written
+        self.returncode = returncode
+        self.cmds = []
+
+    def __call__(self, cmd, **kwargs):
+        self.cmds.append(cmd)
+        with open(cmd[cmd.index("-i") + 1], "rb") as f:
+            assert f.read().count(b"```mermaid\n") >= self.written
+        render_dir = os.path.dirname(cmd[cmd.index("-o") + 1])
+        for i in range(1, self.written + 1):
+            with open(os.path.join(render_dir, f"m-{i}.png"), "wb") as f:
+                f.write(f"image {i}".encode())
+        return subprocess.CompletedProcess(cmd, self.returncode, b"", b"mmdc error")
+
+
+@pytest.fixture(autouse=True)
+def mmdc_path(monkeypatch):
+    monkeypatch.setenv("MMDC_PATH", "mmdc")
+
+
+def test_render_mermaid_cli_batch(tmp_path, monkeypatch):
+    fake = FakeMmdc(written=2)
+    monkeypatch.setattr(subprocess, "run", fake)
+    out_dir = tmp_path / "out"
+
+    paths = mermaid2img.render_mermaid_cli_batch(["graph A", "graph B"], str(out_dir))
+
+    assert paths == [str(out_dir / "m-1.png"), str(out_dir / "m-2.png")]
+    assert (out_dir / "m-2.png").read_bytes() == b"image 2"
+    [cmd] = fake.cmds
+    # The markdown fixture is removed, and so is the render dir
+    assert not os.path.exists(cmd[cmd.index("-i") + 1])
+    assert not os.path.exists(os.path.dirname(cmd[cmd.index("-o") + 1]))
+
+
+def test_render_mermaid_cli_batch_ignores_stale_images(tmp_path, monkeypatch):
+    # An earlier run left m-2.png, this one only writes m-1.png
+    (tmp_path / "m-2.png").write_bytes(b"stale")
+    monkeypatch.setattr(subprocess, "run", FakeMmdc(written=1))
+
+    with pytest.raises(RuntimeError, match="m-2.png"):
+        mermaid2img.render_mermaid_cli_batch(["graph A", "graph B"], str(tmp_path))
+
+
+def test_render_mermaid_cli_batch_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(subprocess, "run", FakeMmdc(written=0, returncode=1))
+    with pytest.raises(RuntimeError, match="mmdc error"):
+        mermaid2img.render_mermaid_cli_batch(["graph A"], str(tmp_path))
+
+
+def test_render_mermaid_cli_batch_empty(tmp_path):
+    assert mermaid2img.render_mermaid_cli_batch([], str(tmp_path)) == []
@@ -0,0 +1,166 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from mdproc import mermaid2img_playwright as mp  # noqa: E402
+
+FLOWCHART = """
+flowchart TD
+    A[Start] --> B[{label}]
+"""
+
+
+@pytest.fixture(scope="module")
+def browser():
+    # Rendering needs the local bundle and an installed Chromium
+    if not mp.MERMAID_BUNDLE_PATH.exists():
+        pytest.skip("assets/mermaid.bundle.js is missing")
+    try:
+        mp._browser_holder.run(mp._browser_holder.pages())
+    except Exception as e:
+        pytest.skip(f"Chromium is not available: {e}")
+    yield
+    mp.close_browser()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("MDPROC_MERMAID_CACHE_DIR", str(tmp_path / "cache"))
+    mp._cache_hits.clear()
+    yield
+    mp._cache_hits.clear()
+
+
+
+def test_cache_key_is_stable():
+    key = mp.cache_key("graph TD\n A-->B")
+    assert key == mp.cache_key("graph TD\n A-->B")
+    assert key.endswith(".png")
+    assert mp.cache_key("graph TD\n A-->B", output_format="svg").endswith(".svg")
+    assert mp.cache_key("graph TD\n A-->B", scale=2) == mp.cache_key(
+        "graph TD\n A-->B", scale=2.0
+    )
+
+
+def test_cache_key_covers_options(monkeypatch):
+    code = "graph TD\n A-->B"
+    keys = {
+        mp.cache_key(code),
+        mp.cache_key("graph TD\n A-->C"),
+        mp.cache_key(code, theme="dark"),
+        mp.cache_key(code, background_color="transparent"),
+        mp.cache_key(code, scale=1.0),
+        mp.cache_key(code, layout="dagre"),
+    }
+    assert len(keys) == 6
+    # Fields are separated, so moving text between them changes the key
+    assert mp.cache_key("a", theme="bc") != mp.cache_key("ab", theme="c")
+    # A new mermaid bundle renders differently, old images must not be reused
+    monkeypatch.setattr(mp, "_bundle_version", lambda: "other bundle")
+    assert mp.cache_key(code) not in keys
+
+
+
+def test_dedupe_misses():
+    misses = [
+        ("graph A", "a1.png", "key-a"),
+        ("graph B", "b.png", "key-b"),
+        ("graph A", "a2.png", "key-a"),
+    ]
+    assert mp._dedupe_misses(misses) == {
+        "key-a": ("graph A", ["a1.png", "a2.png"]),
+        "key-b": ("graph B", ["b.png"]),
+    }
+    assert mp._dedupe_misses([]) == {}
+
+
+def test_cache_misses_copies_hits(tmp_path):
+    options = ("default", "white", 2.0, "elk", "png")
+    key = mp.cache_key("graph A", *options)
+    mp._store_rendered(key, b"image", "png", [str(tmp_path / "first.png")])
+
+    a_path = str(tmp_path / "a.png")
+    b_path = str(tmp_path / "b.png")
+    misses = mp._cache_misses([("graph A", a_path), ("graph B", b_path)], *options)
+    assert misses == [("graph B", b_path, mp.cache_key("graph B", *options))]
+    assert (tmp_path / "a.png").read_bytes() == b"image"
+
+
+
+def test_output_record(tmp_path):
+    key = mp.cache_key("graph A")
+    output_path = str(tmp_path / "a.png")
+    mp._store_rendered(key, b"image", "png", [output_path])
+    assert mp._is_up_to_date(key, output_path)
+    assert not mp._is_up_to_date(mp.cache_key("graph B"), output_path)
+
+    # Rewritten in place by another tool: the cache is intact, the output is stale
+    with open(output_path, "wb") as f:
+        f.write(b"optimized")
+    os.utime(output_path, ns=(0, 0))
+    assert mp._cache_lookup(key).read_bytes() == b"image"
+    assert not mp._is_up_to_date(key, output_path)
+    assert mp._copy_cached(key, output_path)
+    assert (tmp_path / "a.png").read_bytes() == b"image"
+    assert mp._is_up_to_date(key, output_path)
+    # Nothing is written next to the output
+    assert sorted(os.listdir(tmp_path)) == ["a.png", "cache"]
+
+
+def test_single_then_batch(browser, tmp_path):
+    # A sync render must not leave this thread unable to run a batch
+    single = str(tmp_path / "single.png")
+    mp.render_mermaid_playwright(FLOWCHART.format(label="single"), single)
+    assert os.path.getsize(single) > 0
+
+    items = [
+        (FLOWCHART.format(label=f"batch {i}"), str(tmp_path / f"batch{i}.png"))
+        for i in range(3)
+    ]
+    rendered = mp.render_mermaid_playwright_batch(items, concurrency=2)
+    assert rendered == [output_path for _, output_path in items]
+    for _, output_path in items:
+        assert os.path.getsize(output_path) > 0
+
+
+def test_sync_then_async(browser, tmp_path):
+    sync_path = str(tmp_path / "sync.svg")
+    mp.render_mermaid_playwright(
+        FLOWCHART.format(label="sync"), sync_path, output_format="svg"
+    )
+    async_path = str(tmp_path / "async.svg")
+    asyncio.run(
+        mp.render_mermaid_playwright_async(
+            FLOWCHART.format(label="async"), async_path, output_format="svg"
+        )
+    )
+    for output_path in (sync_path, async_path):
+        with open(output_path, encoding="utf-8") as f:
+            assert "<svg" in f.read()
+
+
+def test_process_count(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    monkeypatch.delenv("MDPROC_MERMAID_PROCESSES", raising=False)
+    assert mp._process_count(1) == 1
+    assert mp._process_count(2 * mp.PROCESS_MIN_DIAGRAMS - 1) == 1
+    assert mp._process_count(2 * mp.PROCESS_MIN_DIAGRAMS) == 2
+    assert mp._process_count(100 * mp.PROCESS_MIN_DIAGRAMS) == 4
+    monkeypatch.setenv("MDPROC_MERMAID_PROCESSES", "0")
+    assert mp._process_count(100 * mp.PROCESS_MIN_DIAGRAMS) == 1
+
+
+def test_render_many_processes(browser, tmp_path):
+    items = [
+        (FLOWCHART.format(label=f"process {i}"), str(tmp_path / f"process{i}.png"))
+        for i in range(4)
+    ]
+    # The same diagram twice renders once and is written to both paths
+    items.append((items[0][0], str(tmp_path / "process0_copy.png")))
+    rendered = mp.render_many_processes(items, n_workers=2)
+    assert rendered == [output_path for _, output_path in items]
+    for _, output_path in items:
+        assert os.path.getsize(output_path) > 0